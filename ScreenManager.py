@@ -1,12 +1,13 @@
 import time
+from collections import deque
 from machine import SPI, Pin
 import st7735_buf
 from easydisplay import EasyDisplay
 
 class ScreenManager:
     def __init__(self, width=160, height=80, line_height=16, 
-                 spi_num=1, baudrate=20000000, sck_pin=5, mosi_pin=4,
-                 cs_pin=6, dc_pin=3, res_pin=2, bl_pin=1, rotate=3,
+                 spi_num=1, baudrate=40000000, sck_pin=12, mosi_pin=11,
+                 cs_pin=10, dc_pin=3, res_pin=2, bl_pin=1, rotate=3,
                  font="text_lite_16px_2312.v3.bmf", color=0xFFFF):
         """
         初始化屏幕管理器
@@ -16,8 +17,9 @@ class ScreenManager:
             height: 屏幕高度(像素)
             line_height: 行高(像素)
             spi_num: SPI编号
-            baudrate: SPI波特率
-            sck_pin: SCK引脚
+            baudrate: SPI波特率，默认40MHz；若屏幕花屏或接线较长可降为20000000
+            sck_pin: SCK引脚（默认使用SPI2的IO_MUX引脚12/11/10，
+                     避开config.py中麦克风占用的4/5/6引脚，且支持更高时钟）
             mosi_pin: MOSI引脚
             cs_pin: CS引脚
             dc_pin: DC引脚
@@ -49,30 +51,19 @@ class ScreenManager:
         self.max_lines = height // line_height
         self.current_x = 0
         self.current_y = 0
-        self.lines = []  # 存储每行文本内容
+        # 最近刷新到屏幕的行文本记录（按刷新顺序），仅作日志用途，
+        # 容量为屏幕行数，超出时最早的记录自动丢弃；空行不记录，
+        # 同一行多次追加文本时会产生多条记录，因此不能由位置推算y坐标
+        self.lines = deque([], self.max_lines)
         self.color = color
-
-    @staticmethod
-    def is_chinese_char(char):
-        """判断字符是否为中文字符"""
-        unicode_val = ord(char)
-        return (0x4E00 <= unicode_val <= 0x9FFF or 
-                0x3400 <= unicode_val <= 0x4DBF or 
-                0x20000 <= unicode_val <= 0x2A6DF)
-
-    @staticmethod
-    def is_english_char(char):
-        """判断字符是否为英文字符"""
-        unicode_val = ord(char)
-        return 0x0000 <= unicode_val <= 0x007F
+        # 脏区域（行范围），刷新时只发送这些行的帧缓冲数据
+        self._dirty_y0 = None
+        self._dirty_y1 = None
+        self._defer_depth = 0  # 延迟刷新嵌套深度，大于0时暂不刷新屏幕
 
     def get_char_width(self, char):
-        """获取字符宽度（中文16像素，英文8像素）"""
-        if self.is_chinese_char(char):
-            return 16
-        elif self.is_english_char(char):
-            return 8
-        return 8  # 默认宽度
+        """获取字符宽度（ASCII字符8像素，其他16像素，与EasyDisplay半宽显示一致）"""
+        return 8 if ord(char) < 128 else 16
 
     def add_text(self, text, char_delay=0.01, line_delay=0):
         """
@@ -85,58 +76,94 @@ class ScreenManager:
         """
         line_buffer = []  # 当前行缓冲区
         line_width = 0    # 当前行宽度
+        drawn = char_delay > 0  # 延迟模式下字符已逐个绘制，刷新行时无需重绘
+        
+        # 循环中频繁使用的属性和方法缓存为局部变量
+        # （current_y 会在换行/滚动时改变，仍需从 self 读取）
+        width = self.width
+        line_height = self.line_height
+        color = self.color
+        ed_text = self.ed.text
+        get_char_width = self.get_char_width
+        flush = self._flush_line_buffer
+        new_line = self._new_line
+        scroll_if_needed = self._scroll_if_needed
+        mark_dirty = self._mark_dirty
+        show = self._show
         
         for char in text:
             if char == '\n':  # 换行符
-                self._flush_line_buffer(line_buffer)
-                self._new_line()
+                flush(line_buffer, drawn)
+                new_line()
                 line_buffer = []
                 line_width = 0
                 if line_delay > 0:
                     time.sleep(line_delay)
                 continue
+            if char == '\t':
+                # EasyDisplay 按制表位跳转，宽度随位置变化，统一按空格处理
+                char = ' '
+            elif char < '\x10':
+                # EasyDisplay 既不显示也不前进的控制字符（如 '\r'）直接跳过
+                continue
                 
-            char_width = self.get_char_width(char)
+            char_width = get_char_width(char)
             
             # 检查是否需要换行
-            if line_width + char_width > self.width:
-                self._flush_line_buffer(line_buffer)
-                self._new_line()
+            if line_width + char_width > width:
+                flush(line_buffer, drawn)
+                new_line()
                 line_buffer = []
                 line_width = 0
                 if line_delay > 0:
                     time.sleep(line_delay)
             
-            # 添加到行缓冲区
-            line_buffer.append((char, line_width))
-            line_width += char_width
-            
             # 显示当前字符（如果启用延迟）
-            if char_delay > 0:
-                self.ed.text(char, line_width - char_width, self.current_y, self.color)
-                self.ed.show()
+            if drawn:
+                if not line_buffer:
+                    scroll_if_needed()
+                y = self.current_y
+                ed_text(char, line_width, y, color, show=False)
+                mark_dirty(y, y + line_height)
+                # 空格的刷新延后，随下一个可见字符或行尾一并发送
+                if char != ' ':
+                    show()
                 time.sleep(char_delay)
+            
+            # 添加到行缓冲区
+            line_buffer.append(char)
+            line_width += char_width
         
         # 刷新剩余内容
         if line_buffer:
-            self._flush_line_buffer(line_buffer)
+            flush(line_buffer, drawn)
 
-    def _flush_line_buffer(self, line_buffer):
-        """将行缓冲区内容一次性显示到屏幕"""
+    def _flush_line_buffer(self, line_buffer, drawn=False):
+        """
+        将行缓冲区内容一次性显示到屏幕
+        
+        参数:
+            line_buffer: 当前行的字符列表
+            drawn: 字符是否已逐个绘制到屏幕，为True时只记录行内容
+        """
         if not line_buffer:
             return
             
-        # 检查是否需要滚动
+        line = ''.join(line_buffer)
+        if not drawn:
+            self._scroll_if_needed()
+            # 一次性显示整行
+            self.ed.text(line, 0, self.current_y, self.color, show=False)
+            self._mark_dirty(self.current_y, self.current_y + self.line_height)
+        # 已逐字绘制时只刷新尚未发送的部分（如行尾空格），无改动则不刷新
+        self._show()
+        self.lines.append(line)
+
+    def _scroll_if_needed(self):
+        """当前行超出屏幕底部时向上滚动"""
         if self.current_y >= self.height:
             self._scroll_up()
             self.current_y = self.height - self.line_height
-        
-        # 一次性显示整行
-        for char, x in line_buffer:
-            self.ed.text(char, x, self.current_y, self.color)
-            self.lines.append((char, x, self.current_y))
-        
-        self.ed.show()
 
     def _new_line(self):
         """处理换行"""
@@ -145,20 +172,63 @@ class ScreenManager:
 
     def _scroll_up(self):
         """向上滚动一行"""
-        if hasattr(self.dp, 'scroll'):
-            self.dp.scroll(0, -self.line_height)
-            self.ed.fill_rect(0, self.height - self.line_height, 
-                             self.width, self.line_height, 0)
+        dp = self.dp
+        line_height = self.line_height
+        # 直接将帧缓冲区整体上移一行（FrameBuffer.scroll 逐像素搬移，较慢）
+        # 按一行文本的字节数分块复制，每次源和目标区间相邻不重叠，
+        # 不依赖切片赋值内部 memcpy 对重叠区间的行为
+        buf = dp.buffer
+        size = len(buf)
+        shift = line_height * dp.width * 2
+        mv = memoryview(buf)
+        for off in range(0, size - shift, shift):
+            end = min(off + shift, size - shift)
+            mv[off:end] = mv[off + shift:end + shift]
+        self.ed.fill_rect(0, self.height - line_height, 
+                         self.width, line_height, 0)
+        # 整屏内容已移动，由调用方绘制新行后统一刷新
+        self._mark_dirty(0, self.height)
+
+    def _mark_dirty(self, y0, y1):
+        """将 [y0, y1) 行范围标记为需要刷新"""
+        if self._dirty_y0 is None:
+            self._dirty_y0 = y0
+            self._dirty_y1 = y1
         else:
-            self.ed.fill(0)
-            new_lines = []
-            for char, x, y in self.lines:
-                new_y = y - self.line_height
-                if new_y >= 0:
-                    self.ed.text(char, x, new_y, self.color)
-                    new_lines.append((char, x, new_y))
-            self.lines = new_lines
-        self.ed.show()
+            self._dirty_y0 = min(self._dirty_y0, y0)
+            self._dirty_y1 = max(self._dirty_y1, y1)
+
+    def _show(self):
+        """刷新屏幕，处于延迟刷新期间时只保留脏区域等待统一刷新"""
+        if self._defer_depth == 0:
+            self._flush_dirty()
+
+    def begin_defer(self):
+        """开始延迟刷新，直到对应的 end_defer 调用前不刷新屏幕（可嵌套）"""
+        self._defer_depth += 1
+
+    def end_defer(self):
+        """结束延迟刷新，最外层结束时一次性刷新所有改动"""
+        if self._defer_depth <= 0:
+            raise RuntimeError("end_defer() called without matching begin_defer()")
+        self._defer_depth -= 1
+        if self._defer_depth == 0:
+            self._flush_dirty()
+
+    def _flush_dirty(self):
+        """只将脏区域内的行通过SPI发送到屏幕"""
+        if self._dirty_y0 is None:
+            return
+        dp = self.dp
+        y0 = max(self._dirty_y0, 0)
+        y1 = min(self._dirty_y1, dp.height)
+        self._dirty_y0 = None
+        self._dirty_y1 = None
+        if y0 >= y1:
+            return
+        row_bytes = dp.width * 2
+        dp.set_window(0, y0, dp.width - 1, y1 - 1)
+        dp.write_data(memoryview(dp.buffer)[y0 * row_bytes:y1 * row_bytes])
 
     def display_image(self, file, x, y, key=None, show=True, clear=False, invert=False, color=None, bg_color=None):
         """
@@ -180,10 +250,11 @@ class ScreenManager:
     def clear(self):
         """清空屏幕"""
         self.ed.clear()
-        self.lines = []
+        self.lines = deque([], self.max_lines)
         self.current_x = 0
         self.current_y = 0
-        self.ed.show()
+        self._mark_dirty(0, self.height)
+        self._show()
 
     def display_text(self, text, char_delay=0.005, line_delay=0.01, clear=True):
         """
@@ -195,9 +266,17 @@ class ScreenManager:
             line_delay: 行显示间隔时间(秒)
             clear: 是否清屏
         """
-        if clear:
-            self.clear()
-        self.add_text(text, char_delay=char_delay, line_delay=line_delay)
+        # 无逐字/逐行动画时，清屏和整段文本合并为一次刷新
+        defer = char_delay <= 0 and line_delay <= 0
+        if defer:
+            self.begin_defer()
+        try:
+            if clear:
+                self.clear()
+            self.add_text(text, char_delay=char_delay, line_delay=line_delay)
+        finally:
+            if defer:
+                self.end_defer()
 
     def set_color(self, color):
         """设置文本颜色"""
@@ -2,14 +2,13 @@
 
 import os
 import json
+import micropython
 import asyncio
 import time
-import random
 import ubinascii
-import _thread
 import sys
-from collections import deque
 from machine import I2S, Pin
+from micropython import const
 from aiohttp import ClientSession, WSMsgType
 from config import WS_URL, HEADERS
 from config import MIC_SCK_PIN, MIC_WS_PIN, MIC_SD_PIN
@@ -18,25 +17,109 @@ from config import RATE, CHANNELS, BIT_DEPTH, CHUNK, VOICE_ID
 
 # 导入OLED显示相关变量
 #from oled_display import oled, listen_fb, talk_fb
-# 使用collections.deque和线程锁实现线程安全的队列
+# 使用单生产者/单消费者环形缓冲区实现消息队列，无需线程锁
 
 # 全局变量
 audio_recording = False
 audio_playing = False
 audio_ws = None   # WebSocket连接对象
 audio_in = None   # I2S输入对象（麦克风）
+audio_task = None  # 录音任务
+mic_rx_flag = None  # 麦克风I2S缓冲区填满时由中断回调置位
+audio_resume_event = None  # 恢复录音时置位，唤醒暂停中的录音任务
 audio_out = None  # I2S输出对象（扬声器）
-message_queue = None  # 消息队列，将在chat_client中初始化
-message_queue_lock = None  # 消息队列锁，用于线程安全
+message_queue = None  # 消息队列（环形缓冲区），将在chat_client中初始化
+message_queue_head = 0  # 队首索引，仅由消费者（发送任务）修改
+message_queue_tail = 0  # 队尾索引，仅由生产者（录音任务）修改
 audio_buffer_queue = None  # 音频缓冲队列，用于缓存音频数据
 audio_buffer_lock = None  # 音频缓冲队列锁，用于线程安全
+event_id_counter = 0  # 事件ID计数器
+
+# 事件ID前缀，启动时由硬件随机数生成一次，区分不同次运行产生的ID
+# （RTC未经NTP校时，冷启动后time.time()几乎每次相同，不能用作前缀）
+_ID_PREFIX = ubinascii.hexlify(os.urandom(4)).decode() + "-"
+
+MSG_QUEUE_SIZE = const(1024)  # 环形队列槽位数
+# 为控制消息（如 input_audio_buffer.complete）保留的槽位数，音频帧不能占用，
+# 保证队列被音频占满时控制消息仍能入队
+_CONTROL_RESERVE = const(8)
+
+# 麦克风I2S内部缓冲区可容纳的音频块数
+_MIC_IBUF_CHUNKS = const(4)
+
+# 静音检测只需粗略估计音量，每隔若干个采样取一个即可
+_VOLUME_STRIDE = const(4)
+
+# 每次唤醒最多连续发送的消息数
+_SEND_BATCH = const(16)
+
+# 音频追加消息的JSON模板，格式固定，入队时直接拼接而不调用json.dumps
+_TPL_HEAD = '{"id":"'
+_TPL_MID = '","event_type":"input_audio_buffer.append","data":{"delta":"'
+_TPL_TAIL = '"}}'
+
+# 预分配的音频缓冲区，录音任务重启时复用
+_audio_buffer = bytearray(CHUNK)
+
+# Base64编码表及预分配的编码输出缓冲区
+_B64_TABLE = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_b64_out = bytearray(4 * ((CHUNK + 2) // 3))
+_b64_mv = memoryview(_b64_out)
 
 
 def get_event_id():
-    """生成唯一的事件ID，使用时间戳和随机数代替uuid"""
-    timestamp = int(time.time() * 1000)  # 毫秒级时间戳
-    random_part = random.randint(1000, 9999)  # 4位随机数
-    return f"{timestamp}-{random_part}"
+    """生成唯一的事件ID，使用每次启动随机生成的前缀加单调递增的计数器代替uuid"""
+    global event_id_counter
+    event_id_counter += 1
+    return _ID_PREFIX + str(event_id_counter)
+
+
+@micropython.viper
+def _sum_abs_i16(buf: ptr8, n: int) -> int:
+    """计算16位小端有符号采样的绝对值之和，每隔_VOLUME_STRIDE个采样取一个"""
+    s = 0
+    i = 0
+    step = _VOLUME_STRIDE * 2
+    while i + 1 < n:
+        v = buf[i] | (buf[i + 1] << 8)
+        if v & 0x8000:
+            v = v - 0x10000
+        if v < 0:
+            v = -v
+        s += v
+        i += step
+    return s
+
+
+@micropython.viper
+def _b64_encode(src: ptr8, n: int, dst: ptr8) -> int:
+    """将src的前n个字节Base64编码到dst（不含换行），返回编码后的长度"""
+    tbl = ptr8(_B64_TABLE)
+    i = 0
+    j = 0
+    while i + 2 < n:
+        v = (src[i] << 16) | (src[i + 1] << 8) | src[i + 2]
+        dst[j] = tbl[(v >> 18) & 0x3F]
+        dst[j + 1] = tbl[(v >> 12) & 0x3F]
+        dst[j + 2] = tbl[(v >> 6) & 0x3F]
+        dst[j + 3] = tbl[v & 0x3F]
+        i += 3
+        j += 4
+    if n - i == 1:
+        v = src[i] << 16
+        dst[j] = tbl[(v >> 18) & 0x3F]
+        dst[j + 1] = tbl[(v >> 12) & 0x3F]
+        dst[j + 2] = 61  # '='
+        dst[j + 3] = 61
+        j += 4
+    elif n - i == 2:
+        v = (src[i] << 16) | (src[i + 1] << 8)
+        dst[j] = tbl[(v >> 18) & 0x3F]
+        dst[j + 1] = tbl[(v >> 12) & 0x3F]
+        dst[j + 2] = tbl[(v >> 6) & 0x3F]
+        dst[j + 3] = 61
+        j += 4
+    return j
 
 
 def init_i2s_mic():
@@ -52,7 +135,7 @@ def init_i2s_mic():
             bits=BIT_DEPTH,         # 位深度
             format=I2S.MONO,        # 单声道
             rate=RATE,              # 采样率
-            ibuf=CHUNK * 4          # 输入缓冲区大小
+            ibuf=CHUNK * _MIC_IBUF_CHUNKS  # 输入缓冲区大小
         )
         print("✅ 麦克风I2S初始化成功")
         return audio_in
@@ -83,52 +166,94 @@ def init_i2s_speaker():
         return None
 
 
+def add_audio_to_message_queue(audio_b64):
+    """按模板拼接音频追加消息的JSON文本并加入队列
+
+    空闲槽位只剩为控制消息保留的部分时丢弃该音频并返回False
+    """
+    free = (message_queue_head - message_queue_tail - 1) % MSG_QUEUE_SIZE
+    if free <= _CONTROL_RESERVE:
+        return False
+    frame = "".join((_TPL_HEAD, get_event_id(), _TPL_MID, audio_b64, _TPL_TAIL))
+    return add_to_message_queue(frame)
+
+
+def set_audio_recording(enabled):
+    """切换录音状态，恢复录音时立即唤醒暂停中的录音任务"""
+    global audio_recording
+    audio_recording = enabled
+    if enabled:
+        audio_resume_event.set()
+    else:
+        audio_resume_event.clear()
+
+
+def _on_mic_rx(i2s):
+    """麦克风I2S非阻塞读取完成回调，唤醒录音任务"""
+    mic_rx_flag.set()
+
+
 def add_to_message_queue(message):
-    """将消息添加到队列中，使用线程锁保证线程安全"""
-    global message_queue, message_queue_lock
-    with message_queue_lock:
-        message_queue.append(message)
+    """将消息添加到环形队列尾部，队列已满时丢弃并返回False
+
+    只有一个生产者和一个消费者，各自只修改自己的索引，因此无需加锁
+    """
+    global message_queue_tail
+    nxt = (message_queue_tail + 1) % MSG_QUEUE_SIZE
+    if nxt == message_queue_head:
+        return False
+    message_queue[message_queue_tail] = message
+    message_queue_tail = nxt
     # print(f"已添加消息到队列: {message['event_type']}")
+    return True
 
 
 async def process_message_queue(ws):
     """处理消息队列中的消息并发送到WebSocket"""
-    global message_queue, message_queue_lock
+    global message_queue_head
     while True:
         try:
-            # 检查队列是否有消息
-            message = None
-            with message_queue_lock:
-                if len(message_queue) > 0:
-                    message = message_queue.popleft()
-
-            if message:
-                # 发送消息到WebSocket
+            # 每次唤醒最多连续发送_SEND_BATCH条消息
+            sent = 0
+            while sent < _SEND_BATCH and message_queue_head != message_queue_tail:
+                message = message_queue[message_queue_head]
+                # 发送消息到WebSocket，发送成功后才出队，
+                # 发送期间槽位仍属于队列，生产者不会覆盖它
                 try:
                     # print(f"从队列发送消息: {message['event_type']}")
-                    await ws.send_json(message)
+                    # 音频消息已是拼接好的JSON文本，其他消息为dict
+                    if isinstance(message, str):
+                        await ws.send_str(message)
+                    else:
+                        await ws.send_json(message)
                 except Exception as e:
+                    # 发送失败时消息保留在队首，下次循环重试
                     print(f"发送消息时出错: {e}")
-                    # 如果发送失败，可以选择将消息放回队列
-                    with message_queue_lock:
-                        message_queue.appendleft(message)
-            else:
+                    break
+                message_queue[message_queue_head] = None
+                message_queue_head = (message_queue_head + 1) % MSG_QUEUE_SIZE
+                sent += 1
+
+            if message_queue_head == message_queue_tail:
                 # 队列为空，短暂休眠
                 await asyncio.sleep(0.01)
+            else:
+                # 队列中还有消息，让出CPU给接收循环后继续发送
+                await asyncio.sleep(0)
         except Exception as e:
             print(f"处理消息队列时出错: {e}")
             await asyncio.sleep(0.01)
 
 
-def audio_recording_thread(ws_obj):
-    """音频录制线程，持续采集音频并发送到服务器，包含静音检测功能"""
-    global audio_recording, audio_in
+async def audio_recording_task(ws_obj):
+    """音频录制任务，由I2S中断唤醒采集音频并发送到服务器，包含静音检测功能"""
+    global audio_recording, audio_in, mic_rx_flag
 
     try:
         # 初始化I2S麦克风
         audio_in = init_i2s_mic()
         if not audio_in:
-            print("无法启动录音线程，麦克风I2S初始化失败")
+            print("无法启动录音任务，麦克风I2S初始化失败")
             return
 
         # 显示录音状态
@@ -136,8 +261,7 @@ def audio_recording_thread(ws_obj):
         #oled.blit(listen_fb, 16, 8)  # 显示"耹听中.."
         #oled.show()
 
-        # 分配音频缓冲区
-        audio_buffer = bytearray(CHUNK)  # 修改缓冲区大小
+        audio_buffer = _audio_buffer
 
         # 静音检测相关变量
         SILENCE_THRESHOLD = 100  # 静音阈值，根据实际环境调整
@@ -145,49 +269,46 @@ def audio_recording_thread(ws_obj):
         last_sound_time = time.time()  # 上次检测到声音的时间
         had_voice = False        # 是否已经检测到过人声
 
+        # 切换为非阻塞模式：readinto立即返回，缓冲区填满后触发中断回调
+        mic_rx_flag = asyncio.ThreadSafeFlag()
+        audio_in.irq(_on_mic_rx)
+        bytes_read = audio_in.readinto(audio_buffer)
+
         print("开始录音并发送音频流...")
         while True:  # 修改为无限循环，通过audio_recording变量控制是否录音
-            # 检查是否应该录音
+            # 等待一块音频数据读取完成
+            await mic_rx_flag.wait()
+
+            # 检查是否应该录音，不需要录音时丢弃本块数据，
+            # 暂停期间不再发起读取，等待恢复录音的通知
             if not audio_recording:
-                # 如果不需要录音，短暂休眠后继续检查
-                time.sleep(0.1)
+                await audio_resume_event.wait()
+                # 暂停期间DMA仍在采集，ibuf中积压的是播放期间的旧音频（扬声器回声），
+                # 恢复后先读出并丢弃，避免误判为人声
+                for _ in range(_MIC_IBUF_CHUNKS):
+                    audio_in.readinto(audio_buffer)
+                    await mic_rx_flag.wait()
+                bytes_read = audio_in.readinto(audio_buffer)
                 continue
 
-            # 读取音频数据
+            # 处理音频数据
             try:
-                bytes_read = audio_in.readinto(audio_buffer)
                 if bytes_read > 0:
                     # 计算当前音频块的音量
-                    volume = 0
-                    for i in range(0, bytes_read, 2):  # 16位采样，每个采样2字节
-                        if i + 1 < bytes_read:
-                            # 将两个字节组合成一个16位整数
-                            sample = (audio_buffer[i+1] << 8) | audio_buffer[i]
-                            # 如果最高位为1，则为负数，需要转换
-                            if sample & 0x8000:
-                                sample = -((~sample & 0xFFFF) + 1)
-                            volume += abs(sample)
-
-                    # 计算平均音量
-                    avg_volume = volume / \
-                        (bytes_read // 2) if bytes_read > 0 else 0
+                    num_samples = bytes_read // 2  # 16位采样，每个采样2字节
+                    volume = _sum_abs_i16(audio_buffer, bytes_read)
+
+                    # 计算平均音量（按实际抽样数量取平均）
+                    num_picked = (num_samples + _VOLUME_STRIDE - 1) // _VOLUME_STRIDE
+                    avg_volume = volume / num_picked if num_picked > 0 else 0
 
                     # 对音频数据进行Base64编码
-                    audio_b64 = ubinascii.b2a_base64(
-                        audio_buffer[:bytes_read]).decode('utf-8').strip()
-
-                    # 构造音频数据消息
-                    audio_msg = {
-                        "id": get_event_id(),
-                        "event_type": "input_audio_buffer.append",
-                        "data": {
-                            "delta": audio_b64
-                        }
-                    }
-
-                    # 将消息添加到队列，而不是直接发送
+                    n_enc = _b64_encode(audio_buffer, bytes_read, _b64_out)
+                    audio_b64 = str(_b64_mv[:n_enc], 'ascii')
+
+                    # 将音频数据消息添加到队列，而不是直接发送
                     # 现在使用非异步函数，直接调用
-                    add_to_message_queue(audio_msg)
+                    add_audio_to_message_queue(audio_b64)
 
                     # 静音检测逻辑
                     current_time = time.time()
@@ -209,28 +330,27 @@ def audio_recording_thread(ws_obj):
                                     "id": get_event_id(),
                                     "event_type": "input_audio_buffer.complete"
                                 }
-                                print(
-                                    f"添加完成事件到队列: {complete_msg['event_type']}")
-                                add_to_message_queue(complete_msg)
-                                print("检测到静音1.5秒，已添加完成事件到队列")
-
-                                # 重置状态，准备下一轮录音
-                                had_voice = False
-                                silence_duration = 0
+                                if add_to_message_queue(complete_msg):
+                                    print("检测到静音1.5秒，已添加完成事件到队列")
+
+                                    # 重置状态，准备下一轮录音
+                                    had_voice = False
+                                    silence_duration = 0
+                                else:
+                                    # 队列已满，保留状态，下一块音频时重试
+                                    print("消息队列已满，完成事件稍后重试")
             except Exception as e:
                 print(f"录音过程中发生错误: {e}")
-                time.sleep(0.1)  # 错误后短暂暂停
+                await asyncio.sleep(0.1)  # 错误后短暂暂停
 
-            # 检查是否应该退出线程
-            if not audio_recording and audio_playing:
-                # 如果不需要录音且正在播放音频，则暂停录音但不退出线程
-                time.sleep(0.1)
+            # 处理完毕后再发起下一次读取，避免覆盖正在处理的缓冲区
+            bytes_read = audio_in.readinto(audio_buffer)
 
         # 注意：此处代码不会执行，因为使用了无限循环
         # 停止I2S的逻辑移到了chat_client函数中
 
     except Exception as e:
-        print(f"录音线程发生错误: {e}")
+        print(f"录音任务发生错误: {e}")
         # 关闭I2S设备
         if audio_in:
             try:
@@ -268,7 +388,7 @@ def play_audio_data(audio_data_base64):
 
 async def handle_message(ws, data):
     """处理接收到的消息并发送适当的响应"""
-    global audio_recording, audio_ws, audio_playing
+    global audio_ws, audio_playing, audio_task
 
     event_type = data['event_type']
     if event_type == 'conversation.audio.delta':
@@ -276,7 +396,7 @@ async def handle_message(ws, data):
         try:
             audio_content = data['data']['content']
             # 在播放音频前暂停录音
-            audio_recording = False
+            set_audio_recording(False)
             # print("暂停录音，开始播放音频")
             play_result = play_audio_data(audio_content)
             if play_result:
@@ -293,15 +413,15 @@ async def handle_message(ws, data):
     elif event_type == 'conversation.audio.completed':
         # 音频播放完成，恢复录音
         audio_playing = False
-        audio_recording = True
+        set_audio_recording(True)
         print("音频播放完成，恢复录音")
         # 显示录音状态
         #oled.fill(0)  # 清空屏幕
         #oled.blit(listen_fb, 16, 8)  # 显示"耹听中.."
         #oled.show()
-        # 如果录音线程已经停止，重新启动
+        # 如果录音任务已经停止，重新启动
         if audio_ws and not audio_in:
-            _thread.start_new_thread(audio_recording_thread, (audio_ws,))
+            audio_task = asyncio.create_task(audio_recording_task(audio_ws))
     else:
         pass
         # print("Received event:", json.dumps(data))
@@ -334,21 +454,23 @@ async def handle_message(ws, data):
         await ws.send_json(audio_config)
         print("✅ 已发送音频配置")
 
-    # 处理chat.updated事件，启动录音线程
+    # 处理chat.updated事件，启动录音任务
     elif event_type == 'chat.updated':
-        # 启动录音线程
-        audio_recording = True
+        # 启动录音任务
+        set_audio_recording(True)
         audio_ws = ws
         # 显示录音状态
         #oled.fill(0)  # 清空屏幕
         #oled.blit(listen_fb, 16, 8)  # 显示"耹听中.."
         #oled.show()
-        _thread.start_new_thread(audio_recording_thread, (ws,))
-        print("✅ 已启动录音线程")
+        # 录音任务与WebSocket收发共用主线程的事件循环，
+        # 不需要额外的线程栈，I2S数据由DMA在后台采集
+        audio_task = asyncio.create_task(audio_recording_task(ws))
+        print("✅ 已启动录音任务")
 
     # 处理chat.completed事件，停止录音
     elif event_type == 'chat.completed':
-        audio_recording = False
+        set_audio_recording(False)
         # 清空OLED显示
         #oled.fill(0)
         #oled.show()
@@ -360,18 +482,22 @@ async def handle_message(ws, data):
 
 async def chat_client():
     # 创建会话并连接到WebSocket服务器
-    global audio_recording, audio_playing, message_queue, audio_in, audio_out
+    global audio_recording, audio_playing, message_queue, audio_in, audio_out, audio_task
+    global audio_resume_event
 
-    # 初始化消息队列和队列锁
-    global message_queue_lock
-    message_queue = deque([], 1024)
-    message_queue_lock = _thread.allocate_lock()
+    # 初始化消息队列
+    global message_queue_head, message_queue_tail
+    message_queue = [None] * MSG_QUEUE_SIZE
+    message_queue_head = 0
+    message_queue_tail = 0
 
     # 初始化音频状态
+    audio_resume_event = asyncio.Event()
     audio_recording = False
     audio_playing = False
     audio_in = None
     audio_out = None
+    audio_task = None
 
     # 初始化OLED显示
     #oled.fill(0)  # 清空屏幕
@@ -401,12 +527,18 @@ async def chat_client():
                         sys.print_exception(e)
                         break
 
-                # 取消消息队列处理任务
+                # 取消消息队列处理任务和录音任务
                 queue_task.cancel()
                 try:
                     await queue_task
                 except asyncio.CancelledError:
                     pass
+                if audio_task:
+                    audio_task.cancel()
+                    try:
+                        await audio_task
+                    except asyncio.CancelledError:
+                        pass
 
                 # 确保录音和播放停止
                 audio_recording = False
@@ -427,6 +559,8 @@ async def chat_client():
         # 确保录音和播放停止
         audio_recording = False
         audio_playing = False
+        if audio_task:
+            audio_task.cancel()
         # 关闭I2S设备
         if audio_in:
             try: